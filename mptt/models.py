@@ -102,6 +102,19 @@ class MPTTOptions:
         elif self.order_insertion_by is None:
             self.order_insertion_by = []
 
+        # Intern custom tree attribute names, since they are used for
+        # attribute lookups on every node. The defaults above are string
+        # literals, and interned already.
+        for key in (
+            "left_attr",
+            "right_attr",
+            "tree_id_attr",
+            "level_attr",
+            "parent_attr",
+        ):
+            if key in self.__dict__:
+                setattr(self, key, sys.intern(self.__dict__[key]))
+
     def __iter__(self):
         return ((k, v) for k, v in self.__dict__.items() if k[0] != "_")
 
@@ -633,7 +646,8 @@ class MPTTModel(models.Model, metaclass=MPTTModelBase):
         """
         if hasattr(self, "_cached_children"):
             qs = self._tree_manager.filter(pk__in=[n.pk for n in self._cached_children])
-            qs._result_cache = self._cached_children
+            # Leaves share an empty tuple; the result cache must be a list
+            qs._result_cache = self._cached_children or []
             return qs
         else:
             if self.is_leaf_node():
@@ -236,8 +236,8 @@ def tree_info(items, features=None):
           the tree, ``False`` otherwise.
 
        closed_levels
-          A list of levels which end after the current item. This will
-          be an empty list if the next item is at the same level as the
+          A ``range`` of levels which end after the current item. This
+          will be empty if the next item is at the same level as the
           current item.
 
     Using this filter with unpacking in a ``{% for %}`` tag, you should
@@ -2,11 +2,12 @@
 Utilities for working with lists of model instances which represent
 trees.
 """
-import copy
 import csv
 import itertools
+import operator
 import sys
 
+from django.db.models.query import QuerySet
 from django.utils.encoding import smart_str
 from django.utils.translation import gettext as _
 
@@ -14,6 +15,7 @@ from django.utils.translation import gettext as _
 __all__ = (
     "previous_current_next",
     "tree_item_iterator",
+    "tree_item_iterator_fast",
     "drilldown_tree_for_node",
     "get_cached_trees",
 )
@@ -27,6 +29,19 @@ def previous_current_next(items):
     with ``None`` filling in when there is no previous or next
     available.
     """
+    if isinstance(items, (list, tuple)):
+        # Sequences can be indexed directly, without buffering every item
+        # through ``itertools.tee``.
+        last = len(items) - 1
+        return (
+            (
+                items[i - 1] if i > 0 else None,
+                items[i],
+                items[i + 1] if i < last else None,
+            )
+            for i in range(last + 1)
+        )
+
     extend = itertools.chain([None], items, [None])
     prev, cur, nex = itertools.tee(extend, 3)
     # Advancing an iterator twice when we know there are two items (the
@@ -51,8 +66,8 @@ def tree_item_iterator(items, ancestors=False, callback=str):
           the tree, ``False`` otherwise.
 
        ``'closed_levels'``
-          A list of levels which end after the current item. This will
-          be an empty list if the next item is at the same level as the
+          A ``range`` of levels which end after the current item. This
+          will be empty if the next item is at the same level as the
           current item.
 
     If ``ancestors`` is ``True``, the following key will also be
@@ -76,49 +91,97 @@ def tree_item_iterator(items, ancestors=False, callback=str):
           and performs coercion as required.
 
     """
-    structure = {}
-    opts = None
+    rows = tree_item_iterator_fast(items, ancestors=ancestors, callback=callback)
+    if ancestors:
+        return (
+            (current, {"new_level": new, "closed_levels": closed, "ancestors": anc})
+            for current, new, closed, anc in rows
+        )
+    return (
+        (current, {"new_level": new, "closed_levels": closed})
+        for current, new, closed, _ in rows
+    )
+
+
+def tree_item_iterator_fast(items, ancestors=False, callback=str):
+    """
+    A variant of ``tree_item_iterator`` which generates flat four-tuples
+    of ``(item, new_level, closed_levels, ancestors)`` instead of
+    building a ``dict`` for every item. The values have the same meaning
+    as the corresponding ``tree_item_iterator`` keys; ``ancestors`` is
+    ``None`` unless the ``ancestors`` argument is ``True``.
+    """
+    if ancestors:
+        return _tree_item_iterator_with_ancestors(items, callback)
+    return _tree_item_iterator(items)
+
+
+def _tree_item_iterator(items):
+    """
+    ``tree_item_iterator_fast`` without ancestors.
+    """
     first_item_level = 0
+    previous_level = next_level = None
     for previous, current, next_ in previous_current_next(items):
-        if opts is None:
-            opts = current._mptt_meta
-
-        current_level = getattr(current, opts.level_attr)
         if previous:
-            structure["new_level"] = getattr(previous, opts.level_attr) < current_level
-            if ancestors:
-                # If the previous node was the end of any number of
-                # levels, remove the appropriate number of ancestors
-                # from the list.
-                if structure["closed_levels"]:
-                    structure["ancestors"] = structure["ancestors"][
-                        : -len(structure["closed_levels"])
-                    ]
-                # If the current node is the start of a new level, add its
-                # parent to the ancestors list.
-                if structure["new_level"]:
-                    structure["ancestors"].append(callback(previous))
+            # The current item was ``next_`` on the previous iteration
+            current_level = next_level
+            new_level = previous_level < current_level
         else:
-            structure["new_level"] = True
-            if ancestors:
-                # Set up the ancestors list on the first item
-                structure["ancestors"] = []
+            get_level = operator.attrgetter(current._mptt_meta.level_attr)
+            current_level = get_level(current)
+            new_level = True
+            first_item_level = current_level
+        if next_:
+            next_level = get_level(next_)
+            closed_levels = range(current_level, next_level, -1)
+        else:
+            # All remaining levels need to be closed
+            closed_levels = range(current_level, first_item_level - 1, -1)
+        previous_level = current_level
 
+        yield current, new_level, closed_levels, None
+
+
+def _tree_item_iterator_with_ancestors(items, callback):
+    """
+    ``tree_item_iterator_fast`` with ancestors.
+    """
+    first_item_level = 0
+    previous_level = next_level = None
+    closed_levels = ()
+    # A single ancestors list, grown and shrunk in place as levels open
+    # and close; a copy of it is handed out with each item.
+    ancestor_stack = []
+    for previous, current, next_ in previous_current_next(items):
+        if previous:
+            # The current item was ``next_`` on the previous iteration
+            current_level = next_level
+            new_level = previous_level < current_level
+            # If the previous node was the end of any number of levels,
+            # remove the appropriate number of ancestors from the list.
+            if closed_levels:
+                del ancestor_stack[-len(closed_levels) :]
+            # If the current node is the start of a new level, add its
+            # parent to the ancestors list.
+            if new_level:
+                ancestor_stack.append(callback(previous))
+        else:
+            get_level = operator.attrgetter(current._mptt_meta.level_attr)
+            current_level = get_level(current)
+            new_level = True
             first_item_level = current_level
         if next_:
-            structure["closed_levels"] = list(
-                range(current_level, getattr(next_, opts.level_attr), -1)
-            )
+            next_level = get_level(next_)
+            closed_levels = range(current_level, next_level, -1)
         else:
             # All remaining levels need to be closed
-            structure["closed_levels"] = list(
-                range(current_level, first_item_level - 1, -1)
-            )
+            closed_levels = range(current_level, first_item_level - 1, -1)
+        previous_level = current_level
 
-        # Return a deep copy of the structure dict so this function can
-        # be used in situations where the iterator is consumed
-        # immediately.
-        yield current, copy.deepcopy(structure)
+        # Hand out a copy, so this function can be used in situations
+        # where the iterator is consumed immediately.
+        yield current, new_level, closed_levels, ancestor_stack[:]
 
 
 def drilldown_tree_for_node(
@@ -157,6 +220,10 @@ def drilldown_tree_for_node(
     ``all_descendants``
        If ``True``, return all descendants, not just immediate children.
     """
+    yield from node.get_ancestors()
+    yield node
+    # The children are only looked up once the ancestors and the node
+    # itself have been consumed.
     if all_descendants:
         children = node.get_descendants()
     else:
@@ -165,7 +232,7 @@ def drilldown_tree_for_node(
         children = node._tree_manager.add_related_count(
             children, rel_cls, rel_field, count_attr, cumulative
         )
-    return itertools.chain(node.get_ancestors(), [node], children)
+    yield from children
 
 
 def print_debug_info(qs, file=None):
@@ -186,15 +253,16 @@ def print_debug_info(qs, file=None):
         "pretty",
     )
     writer.writerow(header)
-    for n in qs.order_by("tree_id", "lft"):
-        level = getattr(n, opts.level_attr)
-        row = []
-        for field in header[:-1]:
-            row.append(getattr(n, field))
-
-        row_text = "%s%s" % ("- " * level, str(n))
-        row.append(row_text)
-        writer.writerow(row)
+    # Fetches every column but "pretty" in a single call, as a tuple
+    get_fields = operator.attrgetter(*header[:-1])
+    # Indentation for the "pretty" column, precomputed for common depths
+    prefixes = ["- " * i for i in range(64)]
+    # Stream the nodes rather than loading the whole tree into memory
+    for n in qs.order_by("tree_id", "lft").iterator(chunk_size=2000):
+        row = get_fields(n)
+        level = row[1]
+        prefix = prefixes[level] if level < 64 else "- " * level
+        writer.writerow(row + ("%s%s" % (prefix, str(n)),))
 
 
 def _get_tree_model(model_class):
@@ -236,21 +304,11 @@ def clean_tree_ids(*tree_ids, **kwargs):
     if root_ordering:
         return tree_ids if len(tree_ids) > 1 else tree_ids[0]
 
-    def _clean_tree_id(tree_id, vendor):
-        return (
-            smart_str(tree_id).replace("-", "") if vendor != "postgresql" else tree_id
-        )
-
-    results = tuple()
-    for tree_id in tree_ids:
-        cleaned_tree_id = _clean_tree_id(tree_id, vendor)
-        if not results:
-            results = cleaned_tree_id
-        elif isinstance(results, tuple):
-            results += (cleaned_tree_id,)
-        else:
-            results = (results, cleaned_tree_id)
-    return results
+    if vendor == "postgresql":
+        cleaned = tree_ids
+    else:
+        cleaned = tuple(smart_str(tree_id).replace("-", "") for tree_id in tree_ids)
+    return cleaned[0] if len(cleaned) == 1 else cleaned
 
 
 def get_cached_trees(queryset):
@@ -280,36 +338,45 @@ def get_cached_trees(queryset):
        `Node.objects.filter(**kwargs).get_cached_trees()`
     """
 
+    # Nodes of the current branch, root first. Only the first ``depth``
+    # entries are live; slots past that are overwritten as the walk
+    # descends again, so the list only grows to the tree's maximum depth.
     current_path = []
+    depth = 0
     top_nodes = []
 
     if queryset:
-        # Get the model's parent-attribute name
-        parent_attr = queryset[0]._mptt_meta.parent_attr
-        root_level = None
-        is_filtered = hasattr(queryset, "query") and queryset.query.has_filters()
+        # Get the model's level- and parent-attribute names
+        opts = queryset[0]._mptt_meta
+        level_attr = opts.level_attr
+        parent_attr = opts.parent_attr
+        # Set the root level to the top node level
+        root_level = getattr(queryset[0], level_attr)
+        is_filtered = isinstance(queryset, QuerySet) and queryset.query.has_filters()
         for obj in queryset:
             # Get the current mptt node level
-            node_level = obj.get_level()
-
-            if root_level is None or (is_filtered and node_level < root_level):
-                # First iteration, so set the root level to the top node level
+            node_level = getattr(obj, level_attr)
+
+            if node_level < root_level:
+                if not is_filtered:
+                    # ``queryset`` was a list or other iterable (unable to
+                    # order), and was provided in an order other than
+                    # depth-first
+                    raise ValueError(
+                        _("Node %s not in depth-first order") % (type(queryset),)
+                    )
+                # A filtered queryset may leave out a node's ancestors, so
+                # this node starts a new top level
                 root_level = node_level
 
-            elif node_level < root_level:
-                # ``queryset`` was a list or other iterable (unable to order),
-                # and was provided in an order other than depth-first
-                raise ValueError(
-                    _("Node %s not in depth-first order") % (type(queryset),)
-                )
-
             # Set up the attribute on the node that will store cached children,
-            # which is used by ``MPTTModel.get_children``
-            obj._cached_children = []
+            # which is used by ``MPTTModel.get_children``. Leaves keep the
+            # empty tuple; a list is only allocated once a child shows up.
+            obj._cached_children = ()
 
             # Remove nodes not in the current branch
-            while len(current_path) > node_level - root_level:
-                current_path.pop(-1)
+            if depth > node_level - root_level:
+                depth = node_level - root_level
 
             if node_level == root_level:
                 # Add the root to the list of top nodes, which will be returned
@@ -317,9 +384,12 @@ def get_cached_trees(queryset):
             else:
                 # Cache the parent on the current node, and attach the current
                 # node to the parent's list of children
-                _parent = current_path[-1]
+                _parent = current_path[depth - 1]
                 setattr(obj, parent_attr, _parent)
-                _parent._cached_children.append(obj)
+                if _parent._cached_children:
+                    _parent._cached_children.append(obj)
+                else:
+                    _parent._cached_children = [obj]
 
                 if root_level == 0:
                     # get_ancestors() can use .parent.parent.parent...
@@ -330,6 +400,10 @@ def get_cached_trees(queryset):
             # the next iteration is higher up the tree (a new branch), in which
             # case the paths below it (e.g., this one) will be removed from the
             # current path during the next iteration
-            current_path.append(obj)
+            if depth < len(current_path):
+                current_path[depth] = obj
+            else:
+                current_path.append(obj)
+            depth += 1
 
     return top_nodes
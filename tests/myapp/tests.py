@@ -57,7 +57,13 @@ from mptt.managers import TreeManager
 from mptt.models import MPTTModel
 from mptt.signals import node_moved
 from mptt.templatetags.mptt_tags import cache_tree_children
-from mptt.utils import clean_tree_ids, print_debug_info
+from mptt.utils import (
+    clean_tree_ids,
+    previous_current_next,
+    print_debug_info,
+    tree_item_iterator,
+    tree_item_iterator_fast,
+)
 
 
 def get_tree_details(nodes):
@@ -2161,6 +2167,29 @@ class TreeInfoTestCase(TreeTestCase):
             "<li>8A:Shootemup</li></ul></li><li>10</li><li>11</li></ul>",
         )
 
+    def test_tree_item_iterator_fast(self):
+        nodes = list(Genre.objects.all())
+        for ancestors in (False, True):
+            self.assertEqual(
+                [
+                    (node, new_level, list(closed_levels), ancestor_list)
+                    for node, new_level, closed_levels, ancestor_list in (
+                        tree_item_iterator_fast(nodes, ancestors=ancestors)
+                    )
+                ],
+                [
+                    (
+                        node,
+                        structure["new_level"],
+                        list(structure["closed_levels"]),
+                        structure.get("ancestors"),
+                    )
+                    for node, structure in tree_item_iterator(
+                        nodes, ancestors=ancestors
+                    )
+                ],
+            )
+
 
 class FullTreeTestCase(TreeTestCase):
     fixtures = ["genres.json"]
@@ -3545,3 +3574,11 @@ class TestUtils(TestCase):
             clean_tree_ids(1, 2, 3, root_ordering=True, vendor="some_weird_vendor"),
             (1, 2, 3),
         )
+
+    def test_previous_current_next(self):
+        expected = [(None, 1, 2), (1, 2, 3), (2, 3, None)]
+        self.assertEqual(list(previous_current_next([1, 2, 3])), expected)
+        self.assertEqual(list(previous_current_next((1, 2, 3))), expected)
+        self.assertEqual(list(previous_current_next(iter([1, 2, 3]))), expected)
+        self.assertEqual(list(previous_current_next([1])), [(None, 1, None)])
+        self.assertEqual(list(previous_current_next([])), [])